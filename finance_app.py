@@ -1,633 +1,1098 @@
-import streamlit as st
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime, date
-import time
-import re
-import pdfplumber
-
-# ==========================================
-# 1. VISUAL STYLING & CSS
-# ==========================================
-
-def inject_custom_css():
-    st.markdown("""
-        <style>
-        .card-container { padding: 15px; border-radius: 10px; border: 1px solid #e0e0e0; margin-bottom: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
-        .paid-bg { background-color: #d4edda; border-left: 5px solid #28a745; color: #155724; }
-        .due-bg { background-color: #fff3cd; border-left: 5px solid #ffc107; color: #856404; }
-        .overdue-bg { background-color: #f8d7da; border-left: 5px solid #dc3545; color: #721c24; }
-        .neutral-bg { background-color: #f8f9fa; border-left: 5px solid #6c757d; }
-        .stTabs [data-baseweb="tab-list"] { gap: 8px; }
-        .stTabs [data-baseweb="tab"] { height: 45px; background-color: #ffffff; border-radius: 4px; border: 1px solid #ddd; }
-        .stTabs [aria-selected="true"] { background-color: #f0f2f6; border-bottom: 2px solid #ff4b4b; font-weight: bold; }
-        </style>
-    """, unsafe_allow_html=True)
-
-# ==========================================
-# 2. ROBUST DATA UTILITIES
-# ==========================================
-
-def safe_float(val):
-    if pd.isna(val) or str(val).strip() == "": return 0.0
-    if isinstance(val, (int, float)): return round(float(val), 2)
-    clean = re.sub(r'[^\d.-]', '', str(val))
-    try: return round(float(clean), 2)
-    except ValueError: return 0.0
-
-def safe_date(val):
-    if not val or pd.isna(val) or str(val).strip() == "": return None
-    val = str(val).strip()
-    formats = ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d-%b-%Y", "%Y/%m/%d", "%d-%b-%y", "%d-%m-%y", "%d-%b"]
-    for fmt in formats:
-        try:
-            dt = datetime.strptime(val, fmt)
-            if "%Y" not in fmt and "%y" not in fmt: dt = dt.replace(year=datetime.now().year)
-            return dt.date()
-        except ValueError: continue
-    return None
-
-def get_next_id(df):
-    if df.empty or 'ID' not in df.columns: return 1
-    ids = pd.to_numeric(df['ID'], errors='coerce').fillna(0)
-    return int(ids.max()) + 1 if not ids.empty else 1
-
-def check_duplicate(df, col_name, value, label="Entry", exclude_id=None):
-    if df.empty or col_name not in df.columns: return False
-    if exclude_id: df = df[df['ID'].astype(str) != str(exclude_id)]
-    existing = df[col_name].astype(str).str.strip().str.lower().tolist()
-    if str(value).strip().lower() in existing:
-        st.error(f"❌ Duplicate Error: {label} '{value}' already exists.")
-        return True
-    return False
-
-# ==========================================
-# 3. GOOGLE SHEETS CONNECTION & I/O
-# ==========================================
-
-SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-
-@st.cache_resource
-def connect_gsheets():
-    try:
-        if "gcp_service_account" in st.secrets:
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["gcp_service_account"], SCOPE)
-        else:
-            creds = ServiceAccountCredentials.from_json_keyfile_name("service_account.json", SCOPE)
-        return gspread.authorize(creds).open("MyFinanceDB")
-    except Exception as e:
-        st.error(f"❌ Connection Failed: {e}")
-        st.stop()
-
-def api_retry(func, *args, **kwargs):
-    for i in range(5):
-        try: return func(*args, **kwargs)
-        except Exception as e:
-            if "429" in str(e):
-                time.sleep((i + 1) * 1.5)
-                continue
-            raise e
-    return func(*args, **kwargs)
-
-@st.cache_data(ttl=60)
-def fetch_sheet_data_cached(_sh, sheet_name):
-    return api_retry(_sh.worksheet, sheet_name).get_all_records()
-
-def clear_cache(): st.cache_data.clear()
-
-def get_df(sh, name):
-    required_cols = {
-        "Cards": ["ID", "Name", "Limit", "GraceDays", "MatchCode"],
-        "Statements": ["CardID", "Year", "Month", "Billed", "Paid", "Unbilled", "UnbilledDate", "StmtDate", "DueDate"],
-        "Card_Payments": ["ID", "CardID", "Year", "Month", "Date", "Amount", "Note"],
-        "Loans": ["ID", "Source", "Type", "Category", "Principal", "EMI", "Tenure", "StartDate", "Outstanding", "Status", "DueDay", "MatchCode"],
-        "Loan_Repayments": ["ID", "LoanID", "PaymentDate", "Amount", "Type"],
-        "Active_EMIs": ["ID", "CardID", "Item", "Beneficiary", "TotalVal", "MonthlyEMI", "Start", "Tenure", "Status"],
-        "EMI_Log": ["ID", "EMI_ID", "Date", "Month", "Year", "Amount"],
-        "Banks": ["ID", "Name", "Type", "AccNo", "MatchCode"],
-        "Bank_Balances": ["BankID", "Year", "Month", "Balance"],
-        "Transactions": ["ID", "Date", "Year", "Month", "Type", "Category", "Amount", "Notes", "SourceAccount"]
-    }
-    try:
-        data = fetch_sheet_data_cached(sh, name)
-        df = pd.DataFrame(data)
-        if name in required_cols:
-            if df.empty: return pd.DataFrame(columns=required_cols[name])
-            for c in required_cols[name]:
-                if c not in df.columns: df[c] = ""
-        return df
-    except gspread.WorksheetNotFound:
-        return pd.DataFrame(columns=required_cols.get(name, []))
-    except Exception:
-        return pd.DataFrame()
-
-def update_full_sheet(sh, name, df):
-    ws = api_retry(sh.worksheet, name)
-    ws.clear()
-    ws.append_row(df.columns.tolist())
-    if not df.empty: ws.append_rows(df.values.tolist())
-    clear_cache()
-
-def add_row(sh, name, row):
-    ws = api_retry(sh.worksheet, name)
-    ws.append_row(row)
-    clear_cache()
-
-def update_row_by_id(sh, name, id_val, updated_dict, df_current):
-    idx_list = df_current.index[df_current['ID'].astype(str) == str(id_val)].tolist()
-    if not idx_list: return False
-    idx = idx_list[0]
-    for col, val in updated_dict.items(): df_current.at[idx, col] = val
-    update_full_sheet(sh, name, df_current)
-    return True
-
-def delete_row_by_id(sh, sheet_name, id_val):
-    try:
-        ws = api_retry(sh.worksheet, sheet_name)
-        data = ws.get_all_records()
-        row_idx = next((i + 2 for i, row in enumerate(data) if str(row.get('ID')) == str(id_val)), None)
-        if row_idx:
-            ws.delete_rows(row_idx)
-            clear_cache()
-            return True
-        return False
-    except Exception: return False
-
-def init_sheets(sh):
-    schema = {
-        "Config": ["Key", "Value"],
-        "Cards": ["ID", "Name", "First4", "Last4", "Limit", "GraceDays", "MatchCode"],
-        "Banks": ["ID", "Name", "Type", "AccNo", "MatchCode"],
-        "Loans": ["ID", "Source", "Type", "Category", "Collateral", "Principal", "Rate", "EMI", "Tenure", "StartDate", "Outstanding", "Status", "DueDay", "MatchCode"],
-        "Active_EMIs": ["ID", "CardID", "Item", "Beneficiary", "TotalVal", "MonthlyEMI", "Start", "Tenure", "Status"],
-        "EMI_Log": ["ID", "EMI_ID", "Date", "Month", "Year", "Amount"],
-        "Transactions": ["ID", "Date", "Year", "Month", "Type", "Category", "Amount", "Notes", "SourceAccount"],
-        "Statements": ["CardID", "Year", "Month", "StmtDate", "Billed", "Unbilled", "UnbilledDate", "Paid", "DueDate"],
-        "Bank_Balances": ["BankID", "Year", "Month", "Balance"],
-        "Loan_Repayments": ["ID", "LoanID", "PaymentDate", "Amount", "Type"],
-        "Card_Payments": ["ID", "CardID", "Year", "Month", "Date", "Amount", "Note"]
-    }
-
-    try:
-        ws_list = api_retry(sh.worksheets)
-        existing = [w.title for w in ws_list]
-    except Exception: existing = []
-
-    for name, cols in schema.items():
-        if name not in existing:
-            try:
-                ws = api_retry(sh.add_worksheet, title=name, rows=100, cols=20)
-                api_retry(ws.append_row, cols)
-                time.sleep(0.5)
-            except gspread.exceptions.APIError as e:
-                if "400" in str(e) or "already exists" in str(e).lower(): pass
-                else: raise e
-        else:
-            ws = api_retry(sh.worksheet, name)
-            try: headers = api_retry(ws.row_values, 1)
-            except Exception: headers = []
-            new_headers = [c for c in cols if c not in headers]
-            for i, h in enumerate(new_headers):
-                api_retry(ws.update_cell, 1, len(headers) + i + 1, h)
-                time.sleep(0.5)
-
-# ==========================================
-# 4. COMPONENT: EDITABLE GRID
-# ==========================================
-
-def render_editable_grid(sh, df, sheet_name, key_prefix, hidden_cols=[]):
-    if df.empty:
-        st.info("No records to display.")
-        return
-
-    df_display = df.copy()
-    df_display["Delete"] = False
-
-    col_config = {"Delete": st.column_config.CheckboxColumn(required=True)}
-    for h in hidden_cols: col_config[h] = None
-
-    edited_df = st.data_editor(
-        df_display,
-        key=f"{key_prefix}_editor",
-        column_config=col_config,
-        hide_index=True,
-        use_container_width=True,
-        num_rows="fixed"
-    )
-
-    if st.button("💾 Save Changes", key=f"btn_{key_prefix}"):
-        to_delete = edited_df[edited_df["Delete"] == True]
-        if not to_delete.empty:
-            for _, row in to_delete.iterrows():
-                delete_row_by_id(sh, sheet_name, row['ID'])
-            st.toast("🗑️ Rows deleted!", icon="✅")
-
-        final_df = edited_df.drop(columns=["Delete"])
-        original_cmp = df.copy().reset_index(drop=True)
-        final_cmp = final_df.reset_index(drop=True)
-
-        if not final_cmp.equals(original_cmp):
-            update_full_sheet(sh, sheet_name, final_df)
-            st.toast("💾 Changes synced!", icon="✅")
-            time.sleep(1); st.rerun()
-        elif not to_delete.empty:
-            time.sleep(1); st.rerun()
-        else:
-            st.info("No changes detected.")
-
-# ==========================================
-# 5. PAGE MODULES
-# ==========================================
-
-def render_dashboard(sh, year, month):
-    st.title(f"📊 Dashboard - {month} {year}")
-    with st.spinner("Crunching numbers..."):
-        stmts = get_df(sh, "Statements")
-        bk = get_df(sh, "Bank_Balances")
-
-        liq = 0.0
-        if not bk.empty:
-            curr_bk = bk[(bk['Year'] == year) & (bk['Month'] == month)]
-            liq = curr_bk['Balance'].apply(safe_float).sum()
-
-        bill = 0; paid = 0; unbilled = 0
-        if not stmts.empty:
-            curr_stmts = stmts[(stmts['Year'] == year) & (stmts['Month'] == month)].copy()
-            if not curr_stmts.empty:
-                bill = curr_stmts['Billed'].apply(safe_float).sum()
-                paid = curr_stmts['Paid'].apply(safe_float).sum()
-                unbilled = curr_stmts['Unbilled'].apply(safe_float).sum()
-
-        pending = max(0, bill - paid)
-        liability = pending + unbilled
-
-    c1, c2, c3 = st.columns(3)
-    c1.metric("💰 Net Liquidity", f"₹{liq:,.0f}")
-    c2.metric("🧾 Pending Bills", f"₹{pending:,.0f}", delta_color="inverse")
-    c3.metric("📉 Total Liability", f"₹{liability:,.0f}")
-
-def render_credit_cards(sh, year, month):
-    st.title("💳 Credit Cards")
-    cards = get_df(sh, "Cards")
-    tab_view, tab_manage = st.tabs(["Overview", "Manage Cards"])
-
-    with tab_view:
-        if cards.empty:
-            st.warning("No cards found.")
-            return
-        stmts = get_df(sh, "Statements")
-        cpays = get_df(sh, "Card_Payments")
-
-        for _, row in cards.iterrows():
-            hist_df = cpays[(cpays['CardID'] == row['ID']) & (cpays['Year'] == year) & (cpays['Month'] == month)]
-            match = stmts[(stmts['CardID'] == row['ID']) & (stmts['Year'] == year) & (stmts['Month'] == month)]
-
-            curr_b = 0.0; curr_p = 0.0; curr_d = ""; curr_stmt_dt = ""; curr_unb = 0.0; curr_unb_dt = ""
-            if not match.empty:
-                r = match.iloc[0]
-                curr_b = safe_float(r['Billed'])
-                calc_paid = hist_df['Amount'].apply(safe_float).sum()
-                curr_p = calc_paid if not hist_df.empty else safe_float(r['Paid'])
-                curr_d = str(r['DueDate'])
-                curr_stmt_dt = str(r.get('StmtDate', ''))
-                curr_unb = safe_float(r.get('Unbilled', 0))
-                curr_unb_dt = str(r.get('UnbilledDate', ''))
-
-            rem = max(0, curr_b - curr_p)
-            status_cls = "neutral-bg"
-            if curr_b > 0:
-                if rem <= 1: status_cls = "paid-bg"
-                elif safe_date(curr_d) and (safe_date(curr_d) - date.today()).days < 0: status_cls = "overdue-bg"
-                else: status_cls = "due-bg"
-
-            st.markdown(f"""
-            <div class="card-container {status_cls}">
-                <div style="display:flex; justify-content:space-between;">
-                    <h3>{row['Name']}</h3> <span>Due: ₹{rem:,.2f}</span>
-                </div>
-                <div>Billed: ₹{curr_b:,.2f} | Paid: ₹{curr_p:,.2f} | Unbilled: ₹{curr_unb:,.2f}</div>
-                <div>Stmt: {curr_stmt_dt or '-'} | Due date: {curr_d or '-'}</div>
-            </div>""", unsafe_allow_html=True)
-
-            with st.expander(f"Manage {row['Name']}", expanded=(rem > 0)):
-                with st.form(f"st_{row['ID']}"):
-                    c1, c2, c3 = st.columns(3)
-                    s_dt = c1.date_input("Stmt Date", value=safe_date(curr_stmt_dt))
-                    d_dt = c2.date_input("Due Date", value=safe_date(curr_d) or date.today())
-                    b_amt = c3.number_input("Bill Amt", value=curr_b)
-                    st.markdown("---")
-                    u1, u2 = st.columns(2)
-                    u_amt = u1.number_input("Unbilled Amt", value=curr_unb)
-                    u_date = u2.date_input("Unbilled As Of", value=safe_date(curr_unb_dt) or date.today())
-
-                    if st.form_submit_button("💾 Update Statement"):
-                        if not stmts.empty:
-                            stmts = stmts[~((stmts['CardID'] == row['ID']) & (stmts['Year'] == year) & (stmts['Month'] == month))]
-                        new_row = {"CardID": row['ID'], "Year": year, "Month": month, "StmtDate": str(s_dt), "Billed": b_amt, "Unbilled": u_amt, "UnbilledDate": str(u_date), "Paid": curr_p, "DueDate": str(d_dt)}
-                        stmts = pd.concat([stmts, pd.DataFrame([new_row])], ignore_index=True)
-                        update_full_sheet(sh, "Statements", stmts)
-                        st.toast("Statement updated!", icon="✅")
-                        time.sleep(1); st.rerun()
-
-                with st.form(f"p_{row['ID']}"):
-                    c1, c2 = st.columns([1, 2])
-                    p_amt = c1.number_input("Pay Amount", value=float(rem))
-                    nt = c2.text_input("Notes")
-                    if st.form_submit_button("💸 Record Payment"):
-                        add_row(sh, "Card_Payments", [get_next_id(cpays), row['ID'], year, month, str(date.today()), p_amt, nt])
-                        st.toast("Payment recorded!", icon="✅")
-                        st.success(f"Recorded ₹{p_amt}")
-                        time.sleep(1); st.rerun()
-
-                render_editable_grid(sh, hist_df, "Card_Payments", f"cpgrid_{row['ID']}", hidden_cols=["CardID", "Year", "Month"])
-
-    with tab_manage:
-        action = st.radio("Action", ["Add", "Delete"], horizontal=True)
-        if action == "Add":
-            with st.form("add_c"):
-                n = st.text_input("Name"); mc = st.text_input("Match Code"); l = st.number_input("Limit", min_value=0.0, value=0.0, step=1000.0)
-                if st.form_submit_button("Add Card"):
-                    if not check_duplicate(cards, "Name", n):
-                        add_row(sh, "Cards", [get_next_id(cards), n, "", "", l, 20, mc])
-                        st.toast("Card Added!", icon="🎉"); st.success(f"Added {n}"); time.sleep(1); st.rerun()
-        else:
-            del_n = st.selectbox("Select Card", cards['Name'].unique() if not cards.empty else [])
-            if st.button("Delete"):
-                delete_row_by_id(sh, "Cards", cards[cards['Name'] == del_n].iloc[0]['ID'])
-                st.toast("Deleted!", icon="🗑️"); st.rerun()
-
-def render_loans(sh, year, month):
-    st.title("🏠 Loans")
-    loans = get_df(sh, "Loans")
-    repay = get_df(sh, "Loan_Repayments")
-    tab_view, tab_manage = st.tabs(["Active", "Manage"])
-
-    with tab_view:
-        active = loans[loans['Status'] == 'Active']
-        if active.empty: st.info("No active loans.")
-        for _, row in active.iterrows():
-            matches = repay[repay['LoanID'] == row['ID']]
-            is_paid = False
-            curr_matches = pd.DataFrame()
-            if not matches.empty:
-                curr_matches = matches[matches['PaymentDate'].apply(lambda x: safe_date(x) and safe_date(x).year == year and safe_date(x).strftime("%B") == month)]
-                if not curr_matches.empty: is_paid = True
-
-            style = "paid-bg" if is_paid else "overdue-bg"
-            st.markdown(f"""<div class="card-container {style}">
-                <b>{row['Source']} ({row['Type']})</b><br>
-                EMI: ₹{safe_float(row['EMI']):,.2f} | Bal: ₹{safe_float(row['Outstanding']):,.2f}
-                </div>""", unsafe_allow_html=True)
-
-            with st.expander(f"Repay {row['Source']}"):
-                if st.button(f"Pay EMI (₹{row['EMI']})", key=f"emi_{row['ID']}", disabled=is_paid):
-                    add_row(sh, "Loan_Repayments", [get_next_id(repay), int(row['ID']), str(date.today()), float(row['EMI']), "EMI"])
-                    update_row_by_id(sh, "Loans", row['ID'], {"Outstanding": max(0, safe_float(row['Outstanding']) - safe_float(row['EMI']))}, loans)
-                    st.toast("Paid!", icon="✅"); st.rerun()
-                render_editable_grid(sh, curr_matches, "Loan_Repayments", f"lp_{row['ID']}", hidden_cols=["LoanID"])
-
-    with tab_manage:
-        with st.form("add_l"):
-            src = st.text_input("Source"); typ = st.text_input("Type"); amt = st.number_input("Principal", min_value=0.0, step=1000.0); emi = st.number_input("EMI", min_value=0.0, step=500.0)
-            if st.form_submit_button("Add Loan"):
-                add_row(sh, "Loans", [get_next_id(loans), src, typ, "", "", amt, 0, emi, 12, str(date.today()), amt, "Active", 5, ""])
-                st.toast("Loan Created!", icon="🎉"); st.rerun()
-
-def render_active_emis(sh, year, month):
-    st.title("📉 Active EMIs")
-    emis = get_df(sh, "Active_EMIs")
-    emi_log = get_df(sh, "EMI_Log")
-    cards = get_df(sh, "Cards")
-
-    tab_view, tab_manage = st.tabs(["Active", "Manage"])
-    with tab_view:
-        active = emis[emis['Status'] == 'Active']
-        if active.empty: st.info("No Active EMIs")
-        for _, row in active.iterrows():
-            is_paid = not emi_log[(emi_log['EMI_ID'] == row['ID']) & (emi_log['Year'] == year) & (emi_log['Month'] == month)].empty
-            style = "paid-bg" if is_paid else "due-bg"
-            st.markdown(f"""<div class="card-container {style}"><b>{row['Item']}</b>: ₹{safe_float(row['MonthlyEMI']):,.2f}</div>""", unsafe_allow_html=True)
-            if not is_paid and st.button("Mark Paid", key=f"me_{row['ID']}"):
-                add_row(sh, "EMI_Log", [get_next_id(emi_log), int(row['ID']), str(date.today()), month, year, float(row['MonthlyEMI'])])
-                st.toast("Paid!", icon="✅"); st.rerun()
-
-    with tab_manage:
-        mode = st.radio("Mode", ["Add", "Delete"], horizontal=True)
-        if mode == "Add":
-            if cards.empty:
-                st.warning("⚠️ You must add a Credit Card first.")
-            else:
-                with st.form("add_e"):
-                    cn = st.selectbox("Card", cards['Name'].unique())
-                    it = st.text_input("Item"); val = st.number_input("Total", min_value=0.0, step=500.0); mon = st.number_input("Monthly", min_value=0.0, step=500.0)
-                    if st.form_submit_button("Add Plan"):
-                        cid = cards[cards['Name'] == cn].iloc[0]['ID']
-                        add_row(sh, "Active_EMIs", [get_next_id(emis), int(cid), it, "Self", val, mon, str(date.today()), 12, "Active"])
-                        st.toast("EMI Added!", icon="🎉"); st.rerun()
-        else:
-            del_e = st.selectbox("Select", emis['Item'].unique() if not emis.empty else [])
-            if st.button("Delete"):
-                delete_row_by_id(sh, "Active_EMIs", emis[emis['Item'] == del_e].iloc[0]['ID']); st.toast("Deleted!"); st.rerun()
-
-def render_bank_accounts(sh, year, month):
-    st.title("🏦 Bank Accounts")
-    banks = get_df(sh, "Banks")
-    tab_view, tab_manage = st.tabs(["Balances", "Manage"])
-    with tab_view:
-        bal_df = get_df(sh, "Bank_Balances")
-        with st.form("bal_up"):
-            updates = {}
-            for _, r in banks.iterrows():
-                curr = 0.0
-                if not bal_df.empty:
-                    match = bal_df[(bal_df['BankID'] == r['ID']) & (bal_df['Year'] == year) & (bal_df['Month'] == month)]
-                    if not match.empty: curr = safe_float(match.iloc[0]['Balance'])
-                updates[r['ID']] = st.number_input(f"{r['Name']}", value=curr)
-            if st.form_submit_button("💾 Save Balances"):
-                df = get_df(sh, "Bank_Balances")
-                if not df.empty: df = df[~((df['Year'] == year) & (df['Month'] == month))]
-                new_rows = [{"BankID": bid, "Year": year, "Month": month, "Balance": val} for bid, val in updates.items()]
-                df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
-                update_full_sheet(sh, "Bank_Balances", df)
-                st.toast("Synced!", icon="✅"); st.success("Balances updated.")
-    with tab_manage:
-        with st.form("add_b"):
-            bn = st.text_input("Name"); mc = st.text_input("Match Code")
-            if st.form_submit_button("Add Bank"):
-                add_row(sh, "Banks", [get_next_id(banks), bn, "Savings", "", mc]); st.toast("Bank Added!", icon="🎉"); st.rerun()
-
-# ==========================================
-# 5b. INCOME / EXPENSES (Smart Upload PDF + ROBUST Excel)
-# ==========================================
-
-def parse_statement_text_to_df(text: str) -> pd.DataFrame:
-    rows = []
-    line_pattern = re.compile(r'(?P<date>\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\s+(?P<category>[A-Za-z ]+?)\s+(?P<amount>[-+]?\d[\d,]*\.?\d*)\s*(?P<note>.*)')
-    for line in text.splitlines():
-        m = line_pattern.search(line)
-        if not m: continue
-        dt = safe_date(m.group("date"))
-        if not dt: continue
-        amt = safe_float(m.group("amount"))
-        rows.append({
-            "Date": dt, "Year": dt.year, "Month": dt.strftime("%B"),
-            "Type": "Expense" if amt < 0 else "Income",
-            "Category": m.group("category").strip(),
-            "Amount": abs(amt), "Notes": m.group("note").strip(), "SourceAccount": ""
-        })
-    return pd.DataFrame(rows) if rows else pd.DataFrame()
-
-def load_bank_statement(uploaded_file):
-    """
-    Tries multiple engines to load tricky bank statements (Fake XLSX, HTML, XLS).
-    """
-    # 1. Try standard XLSX (openpyxl)
-    try:
-        uploaded_file.seek(0)
-        return pd.read_excel(uploaded_file, engine='openpyxl')
-    except Exception: pass
-
-    # 2. Try old XLS (xlrd)
-    try:
-        uploaded_file.seek(0)
-        return pd.read_excel(uploaded_file, engine='xlrd')
-    except Exception: pass
-
-    # 3. Try HTML Table (fake xls/xlsx)
-    try:
-        uploaded_file.seek(0)
-        dfs = pd.read_html(uploaded_file)
-        if dfs: return dfs[0]
-    except Exception: pass
-
-    # 4. Try CSV
-    try:
-        uploaded_file.seek(0)
-        return pd.read_csv(uploaded_file, sep=None, engine='python')
-    except Exception: pass
-
-    return None
-
-def render_transactions(sh, year, month):
-    st.title("💵 Income / Expenses")
-    tx_df = get_df(sh, "Transactions")
-    tab_quick, tab_smart, tab_view = st.tabs(["Quick Entry", "Smart Upload", "Transactions"])
-
-    with tab_quick:
-        st.subheader("Quick manual entry")
-        with st.form("quick_entry"):
-            c1, c2, c3 = st.columns(3)
-            dt = c1.date_input("Date", value=date.today())
-            typ = c2.selectbox("Type", ["Income", "Expense"])
-            cat = c3.text_input("Category")
-            c4, c5 = st.columns(2)
-            amt = c4.number_input("Amount", min_value=0.0, step=100.0)
-            src = c5.text_input("Source Account", value="")
-            note = st.text_input("Notes", value="")
-            if st.form_submit_button("➕ Add Transaction"):
-                row = {"ID": get_next_id(tx_df), "Date": str(dt), "Year": dt.year, "Month": dt.strftime("%B"), "Type": typ, "Category": cat, "Amount": amt, "Notes": note, "SourceAccount": src}
-                new_df = pd.concat([tx_df, pd.DataFrame([row])], ignore_index=True)
-                update_full_sheet(sh, "Transactions", new_df)
-                st.toast("Transaction added!", icon="✅"); st.rerun()
-
-    with tab_smart:
-        st.subheader("Smart upload from statement (PDF / Excel)")
-        uploaded = st.file_uploader("Upload statement file", type=["pdf", "xls", "xlsx"], key="stmt_upload")
-        parse_btn = st.button("📄 Parse file")
-        parsed_df = None
-
-        if uploaded and parse_btn:
-            file_ext = uploaded.name.split(".")[-1].lower()
-            if file_ext == "pdf":
-                try:
-                    with pdfplumber.open(uploaded) as pdf:
-                        all_text = "".join([page.extract_text() or "" for page in pdf.pages])
-                    parsed_df = parse_statement_text_to_df(all_text)
-                    if parsed_df.empty: st.warning("No transactions detected from PDF.")
-                    else: st.success(f"Detected {len(parsed_df)} candidate transactions.")
-                except Exception as e: st.error(f"Error reading PDF: {e}")
-            else:
-                # --- ROBUST EXCEL LOADER ---
-                df_raw = load_bank_statement(uploaded)
-                if df_raw is None or df_raw.empty:
-                    st.error("Failed to read file. It may be encrypted or an unsupported format.")
-                else:
-                    df = df_raw.copy()
-                    # Header Heuristic
-                    if not any(x in str(col).lower() for col in df.columns for x in ['date', 'txn']):
-                        for i, row in df.head(20).iterrows():
-                            if any('date' in s for s in row.astype(str).str.lower()):
-                                df.columns = row; df = df.iloc[i+1:]; break
-                    
-                    # Column Mapping
-                    col_map = {}
-                    for col in df.columns:
-                        lc = str(col).strip().lower()
-                        if "date" in lc: col_map[col] = "Date"
-                        elif any(x in lc for x in ["amount", "amt", "debit", "withdraw"]): col_map[col] = "Amount"
-                        elif any(x in lc for x in ["desc", "narration", "particulars"]): col_map[col] = "Notes"
-                    
-                    df = df.rename(columns=col_map)
-                    rows = []
-                    for _, r in df.iterrows():
-                        dt = safe_date(r.get("Date"))
-                        if not dt: continue
-                        amt = safe_float(r.get("Amount"))
-                        rows.append({
-                            "Date": dt, "Year": dt.year, "Month": dt.strftime("%B"),
-                            "Type": "Expense" if amt < 0 else "Income", # Logic assumes negative or debit column
-                            "Category": "Imported",
-                            "Amount": abs(amt), "Notes": str(r.get("Notes", "")), "SourceAccount": ""
-                        })
-                    parsed_df = pd.DataFrame(rows)
-                    if parsed_df.empty: st.warning("No valid rows found.")
-                    else: st.success(f"Detected {len(parsed_df)} transactions.")
-
-        if 'parsed_upload_df' not in st.session_state: st.session_state.parsed_upload_df = pd.DataFrame()
-        if parsed_df is not None and not parsed_df.empty: st.session_state.parsed_upload_df = parsed_df
-
-        if not st.session_state.parsed_upload_df.empty:
-            review_df = st.data_editor(st.session_state.parsed_upload_df, num_rows="dynamic", use_container_width=True, hide_index=True)
-            if st.button("💾 Save to Transactions"):
-                base = get_next_id(tx_df)
-                review_df.insert(0, "ID", range(base, base + len(review_df)))
-                for c in ["Type", "Category", "SourceAccount"]:
-                    if c not in review_df.columns: review_df[c] = ""
-                combined = pd.concat([tx_df, review_df], ignore_index=True)
-                update_full_sheet(sh, "Transactions", combined)
-                st.toast("Smart upload saved!", icon="✅"); st.session_state.parsed_upload_df = pd.DataFrame(); st.rerun()
-
-    with tab_view:
-        st.subheader("Browse / edit transactions")
-        if tx_df.empty: st.info("No transactions recorded yet."); return
-        render_editable_grid(sh, tx_df[(tx_df["Year"] == year) & (tx_df["Month"] == month)], "Transactions", "tx_grid")
-
-# ==========================================
-# 6. MAIN APP LOOP
-# ==========================================
-
-def main():
-    st.set_page_config(page_title="Finance Hub", layout="wide", page_icon="📈")
-    inject_custom_css()
-    with st.status("🚀 System Check...", expanded=True) as status:
-        sh = connect_gsheets()
-        if 'init_db' not in st.session_state: init_sheets(sh); st.session_state['init_db'] = True
-        status.update(label="System Online", state="complete", expanded=False)
-
-    st.sidebar.title("☁️ Finance Hub")
-    curr_y = datetime.now().year
-    year = st.sidebar.selectbox("Year", range(curr_y - 1, curr_y + 5), index=1)
-    month = st.sidebar.selectbox("Month", ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"], index=datetime.now().month - 1)
-    choice = st.sidebar.radio("Go To", ["Dashboard", "Credit Cards", "Loans", "Active EMIs", "Bank Accounts", "Income/Expenses"])
-    if st.sidebar.button("🔄 Refresh Data"): clear_cache(); st.rerun()
-
-    if choice == "Dashboard": render_dashboard(sh, year, month)
-    elif choice == "Credit Cards": render_credit_cards(sh, year, month)
-    elif choice == "Loans": render_loans(sh, year, month)
-    elif choice == "Active EMIs": render_active_emis(sh, year, month)
-    elif choice == "Bank Accounts": render_bank_accounts(sh, year, month)
-    elif choice == "Income/Expenses": render_transactions(sh, year, month)
-
-if __name__ == "__main__":
-    main()
+import streamlit as st
+import pandas as pd
+
+pd.set_option('mode.copy_on_write', True)
+import gspread
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, date, timedelta
+import time
+import random
+import re
+import hashlib
+import json
+import os
+
+# ==========================================
+# 1. VISUAL STYLING & CSS
+# ==========================================
+
+def inject_custom_css():
+    st.markdown("""
+        <style>
+        .card-container { padding: 15px; border-radius: 10px; border: 1px solid #e0e0e0; margin-bottom: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+        .paid-bg { background-color: #d4edda; border-left: 5px solid #28a745; color: #155724; }
+        .due-bg { background-color: #fff3cd; border-left: 5px solid #ffc107; color: #856404; }
+        .overdue-bg { background-color: #f8d7da; border-left: 5px solid #dc3545; color: #721c24; }
+        .neutral-bg { background-color: #f8f9fa; border-left: 5px solid #6c757d; }
+        .stTabs [data-baseweb="tab-list"] { gap: 8px; }
+        .stTabs [data-baseweb="tab"] { height: 45px; background-color: #ffffff; border-radius: 4px; border: 1px solid #ddd; }
+        .stTabs [aria-selected="true"] { background-color: #f0f2f6; border-bottom: 2px solid #ff4b4b; font-weight: bold; }
+        </style>
+    """, unsafe_allow_html=True)
+
+# ==========================================
+# 2. ROBUST DATA UTILITIES
+# ==========================================
+
+_CLEAN_NUM = re.compile(r'[^\d.\-]')
+_PLAIN_NUM = re.compile(r'-?\d+(\.\d+)?$')
+_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d-%b-%Y", "%Y/%m/%d", "%d-%b-%y", "%d-%m-%y", "%d-%b")
+
+def safe_float(val):
+    # Fast path for plain numbers — skips the pd.isna scalar check, which is
+    # surprisingly costly when this runs per cell.
+    if type(val) is float: return round(val, 2) if val == val else 0.0
+    if type(val) is int: return float(val)
+    if pd.isna(val) or str(val).strip() == "": return 0.0
+    if isinstance(val, (int, float)): return round(float(val), 2)
+    s = str(val).strip()
+    clean = s if _PLAIN_NUM.match(s) else _CLEAN_NUM.sub('', s)
+    try: return round(float(clean), 2)
+    except ValueError: return 0.0
+
+def to_float_series(s):
+    """Vectorized safe_float for whole columns — one C-level pass instead of per-cell apply."""
+    return pd.to_numeric(s.astype(str).str.replace(r'[^\d.\-]', '', regex=True), errors='coerce').fillna(0.0).round(2)
+
+# Pure string→date parsing, memoized: sheets repeat the same date strings many
+# times per render, so the strptime format loop runs once per distinct string.
+@lru_cache(maxsize=4096)
+def _parse_date_str(val):
+    for fmt in _DATE_FORMATS:
+        try:
+            dt = datetime.strptime(val, fmt)
+            if "%Y" not in fmt and "%y" not in fmt: dt = dt.replace(year=datetime.now().year)
+            return dt.date()
+        except ValueError: continue
+    return None
+
+# Sheets date-typed cells come back as day serials (days since 1899-12-30)
+# under UNFORMATTED_VALUE; this window covers roughly 1927–2173.
+_SERIAL_EPOCH = date(1899, 12, 30)
+_SERIAL_MIN, _SERIAL_MAX = 10000, 100000
+
+def safe_date(val):
+    if isinstance(val, datetime): return val.date()
+    if isinstance(val, date): return val
+    if isinstance(val, (int, float)) and not isinstance(val, bool):
+        return _SERIAL_EPOCH + timedelta(days=int(val)) if _SERIAL_MIN <= val <= _SERIAL_MAX else None
+    if not val or pd.isna(val) or str(val).strip() == "": return None
+    return _parse_date_str(str(val).strip())
+
+def parse_dates_series(s):
+    """Vectorized safe_date for whole columns, trying formats in the same order."""
+    # ISO first (mixed+dayfirst would flip its day and month), then the mixed
+    # day-first parser for the usual statement formats.
+    # Convert Sheets day serials first (see safe_date), then parse the strings.
+    nums = pd.to_numeric(s, errors='coerce')
+    serial = nums.between(_SERIAL_MIN, _SERIAL_MAX)
+    out = pd.to_datetime(s.where(~serial), errors='coerce', format='%Y-%m-%d')
+    if serial.any(): out[serial] = pd.Timestamp(_SERIAL_EPOCH) + pd.to_timedelta(nums[serial].astype('int64'), unit='D')
+    miss = out.isna() & s.notna()
+    if miss.any(): out[miss] = pd.to_datetime(s[miss], errors='coerce', dayfirst=True, format='mixed')
+    # format='mixed' parses year-less dates ("03-Jun") to year 0001 rather than
+    # NaT; treat implausible years as unparsed so the scalar fallback gets them
+    # and fills in the current year, matching safe_date.
+    bogus = out.notna() & (out.dt.year < 1970)
+    if bogus.any(): out[bogus] = pd.NaT
+    # Anything still unparsed (e.g. day-month with no year) gets the scalar
+    # fallback — only on the misses, so the C path still does the bulk.
+    miss = out.isna() & s.notna()
+    if miss.any(): out[miss] = pd.to_datetime(s[miss].map(safe_date), errors='coerce')
+    return out
+
+def get_next_id(df, name=None):
+    if name is not None:
+        # Session-level high-water mark: seed once from the frame, then mint O(1).
+        counters = st.session_state.setdefault('next_id', {})
+        if name not in counters: counters[name] = get_next_id(df)
+        nid = counters[name]
+        counters[name] = nid + 1
+        return nid
+    if len(df) == 0 or 'ID' not in df.columns: return 1
+    col = df['ID']
+    if col.dtype.kind in 'iu': return int(col.max()) + 1
+    ids = pd.to_numeric(col, errors='coerce').fillna(0)
+    return int(ids.max()) + 1 if not ids.empty else 1
+
+def filter_month(df, year, month):
+    """Slice a frame to one (Year, Month) via a groups dict cached on attrs — O(1) after the first call."""
+    if df.empty or 'Year' not in df.columns or 'Month' not in df.columns: return df
+    groups = df.attrs.get('ym_groups')
+    if groups is None:
+        # Plain tuples, not the raw .indices arrays: attrs propagate to every
+        # slice and pandas compares them with ==, which ndarray values break.
+        groups = {k: tuple(v) for k, v in df.groupby(['Year', 'Month']).indices.items()}
+        df.attrs['ym_groups'] = groups
+    idx = groups.get((year, month), ())
+    return df.take(list(idx)) if len(idx) else df.iloc[0:0]
+
+def reserve_ids(df, name, n):
+    """Reserve a contiguous block of n IDs from the session counter, returning the first."""
+    base = get_next_id(df, name)
+    st.session_state['next_id'][name] = base + n
+    return base
+
+def check_duplicate(df, col_name, value, label="Entry", exclude_id=None):
+    if df.empty or col_name not in df.columns: return False
+    if exclude_id is not None:
+        # attrs propagate through the filter, so the cached full-frame set
+        # would report the excluded row's own value — build fresh, uncached.
+        df = df[df['ID'].astype(str) != str(exclude_id)]
+        existing = frozenset(df[col_name].astype(str).str.strip().str.lower())
+    else:
+        existing = df.attrs.get(f'{col_name}_set')
+        if existing is None:
+            existing = frozenset(df[col_name].astype(str).str.strip().str.lower())
+            df.attrs[f'{col_name}_set'] = existing
+    if str(value).strip().lower() in existing:
+        st.error(f"❌ Duplicate Error: {label} '{value}' already exists.")
+        return True
+    return False
+
+# ==========================================
+# 3. GOOGLE SHEETS CONNECTION & I/O
+# ==========================================
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+@st.cache_resource
+def connect_gsheets():
+    try:
+        if "gcp_service_account" in st.secrets:
+            creds = Credentials.from_service_account_info(dict(st.secrets["gcp_service_account"]), scopes=SCOPE)
+        else:
+            creds = Credentials.from_service_account_file("service_account.json", scopes=SCOPE)
+        gc = gspread.authorize(creds)
+        # Keep pooled TLS connections alive across Sheets calls instead of re-handshaking.
+        gc.http_client.session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+        return gc.open("MyFinanceDB")
+    except Exception as e:
+        st.error(f"❌ Connection Failed: {e}")
+        st.stop()
+
+RETRY_CAP = 30  # seconds; truncates the exponential backoff
+
+def api_retry(func, *args, **kwargs):
+    for i in range(6):
+        try: return func(*args, **kwargs)
+        except Exception as e:
+            resp = getattr(e, 'response', None)
+            status = getattr(resp, 'status_code', None)
+            if status in (429, 500, 502, 503, 504) or "429" in str(e):
+                wait = min(RETRY_CAP, (2 ** i) + random.random())
+                retry_after = resp.headers.get('Retry-After') if resp is not None and getattr(resp, 'headers', None) else None
+                try: wait = max(wait, float(retry_after))
+                except (TypeError, ValueError): pass
+                time.sleep(wait)
+                continue
+            raise e
+    return func(*args, **kwargs)
+
+# Client-side write throttle. Sheets allows ~60 writes/min/user; smoothing
+# bursts to ~1/s (with a 3-call burst allowance) avoids tripping 429s and the
+# retry ladder they trigger. Reads are not throttled.
+_WRITE_BUCKET = {'tokens': 3.0, 'ts': 0.0}
+
+def _throttle_write(rate=1.0, capacity=3.0):
+    b = _WRITE_BUCKET
+    now = time.monotonic()
+    b['tokens'] = min(capacity, b['tokens'] + (now - b['ts']) * rate)
+    b['ts'] = now
+    if b['tokens'] < 1.0:
+        time.sleep((1.0 - b['tokens']) / rate)
+        b['tokens'] = 0.0
+    else:
+        b['tokens'] -= 1.0
+
+def write_retry(func, *args, **kwargs):
+    _throttle_write()
+    return api_retry(func, *args, **kwargs)
+
+@st.cache_resource
+def get_ws(_sh, name):
+    return api_retry(_sh.worksheet, name)
+
+@st.cache_resource
+def get_sheet_titles(_sh):
+    return [w.title for w in api_retry(_sh.worksheets)]
+
+# Small on-disk layer under the in-memory caches so an app restart within the
+# TTL window serves sheet values locally instead of refetching everything.
+# JSON, not Parquet: the payload is ragged rows of mixed str/int/float, which
+# JSON round-trips losslessly.
+_DISK_CACHE = ".cache"
+
+def _disk_read(name, ttl=60):
+    try:
+        path = os.path.join(_DISK_CACHE, f"{name}.json")
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path) as f: return json.load(f)
+    except (OSError, ValueError): pass
+    return None
+
+def _disk_write(name, values):
+    try:
+        os.makedirs(_DISK_CACHE, exist_ok=True)
+        with open(os.path.join(_DISK_CACHE, f"{name}.json"), 'w') as f: json.dump(values, f)
+    except OSError: pass
+
+def _disk_drop(name):
+    try: os.remove(os.path.join(_DISK_CACHE, f"{name}.json"))
+    except OSError: pass
+
+# cache_resource (not cache_data): the returned values are never mutated by
+# callers — get_df builds a fresh DataFrame from them — so we can skip
+# cache_data's hash-and-copy on every hit.
+@st.cache_resource(ttl=60, max_entries=16, show_spinner=False)
+def fetch_sheet_data_cached(_sh, sheet_name):
+    cached = _disk_read(sheet_name)
+    if cached is not None: return cached
+    resp = api_retry(_sh.values_get, f"'{sheet_name}'!A:Z", params={'valueRenderOption': 'UNFORMATTED_VALUE'})
+    values = resp.get('values', [])
+    _disk_write(sheet_name, values)
+    return values
+
+@st.cache_resource(ttl=60, max_entries=16, show_spinner=False)
+def fetch_many_cached(_sh, names):
+    ranges = [f"'{n}'!A:Z" for n in names]
+    resp = api_retry(_sh.values_batch_get, ranges, params={'valueRenderOption': 'UNFORMATTED_VALUE'})
+    all_values = [vr.get('values', []) for vr in resp.get('valueRanges', [])]
+    for n, vals in zip(names, all_values): _disk_write(n, vals)
+    return all_values
+
+def values_to_df(values):
+    """Header row + data rows straight into a DataFrame — no per-row dict detour."""
+    if not values: return pd.DataFrame()
+    header = values[0]
+    rows = [r[:len(header)] + [""] * (len(header) - len(r)) for r in values[1:]]
+    return pd.DataFrame(rows, columns=header)
+
+def clear_cache():
+    fetch_sheet_data_cached.clear()
+    fetch_many_cached.clear()
+    # Refresh exists to pick up external edits — drop the ID high-water marks
+    # too, or rows added from another device lead to duplicate IDs.
+    st.session_state.pop('next_id', None)
+    try:
+        for f in os.listdir(_DISK_CACHE): _disk_drop(f[:-5])
+    except OSError: pass
+
+# Batch-read keys seen this session, so a write can evict just the cached
+# reads that include the touched sheet instead of nuking everything.
+_BATCH_KEYS = set()
+
+def invalidate(name):
+    st.session_state.get('next_id', {}).pop(name, None)
+    _disk_drop(name)
+    try: fetch_sheet_data_cached.clear(None, name)
+    except Exception: fetch_sheet_data_cached.clear()
+    for key in list(_BATCH_KEYS):
+        if name in key:
+            try: fetch_many_cached.clear(None, key)
+            except Exception: fetch_many_cached.clear()
+
+REQUIRED_COLS = {
+    "Cards": ["ID", "Name", "Limit", "GraceDays", "MatchCode"],
+    "Statements": ["CardID", "Year", "Month", "StmtDate", "Billed", "Unbilled", "UnbilledDate", "Paid", "DueDate"],
+    "Card_Payments": ["ID", "CardID", "Year", "Month", "Date", "Amount", "Note"],
+    "Loans": ["ID", "Source", "Type", "Category", "Principal", "EMI", "Tenure", "StartDate", "Outstanding", "Status", "DueDay", "MatchCode"],
+    "Loan_Repayments": ["ID", "LoanID", "PaymentDate", "Amount", "Type"],
+    "Active_EMIs": ["ID", "CardID", "Item", "Beneficiary", "TotalVal", "MonthlyEMI", "Start", "Tenure", "Status"],
+    "EMI_Log": ["ID", "EMI_ID", "Date", "Month", "Year", "Amount"],
+    "Banks": ["ID", "Name", "Type", "AccNo", "MatchCode"],
+    "Bank_Balances": ["BankID", "Year", "Month", "Balance"],
+    "Transactions": ["ID", "Date", "Year", "Month", "Type", "Category", "Amount", "Notes", "SourceAccount"]
+}
+
+def apply_schema(name, df):
+    if name in REQUIRED_COLS:
+        # Keep the sheet's actual header order — callers map row positions to
+        # ranged writes off these columns, so substituting the REQUIRED_COLS
+        # order for a headered-but-empty sheet would scramble appends.
+        if df.columns.empty: df = pd.DataFrame(columns=REQUIRED_COLS[name])
+        missing = [c for c in REQUIRED_COLS[name] if c not in df.columns]
+        if missing: df = df.reindex(columns=list(df.columns) + missing, fill_value="")
+    if name == "Transactions" and not df.empty:
+        # Dictionary-encode the low-cardinality string columns; filters then compare codes, not strings.
+        for c in ('Type', 'Category', 'SourceAccount'):
+            if c in df.columns: df[c] = df[c].astype('category')
+    if 'ID' in df.columns:
+        # Positional index per ID, built once at ingest so lookups skip astype(str) scans.
+        df.attrs['id_index'] = {str(v): i for i, v in enumerate(df['ID'].to_numpy())}
+    return df
+
+# Built frames memoized per raw values list, so repeat get_df calls within the
+# cache window skip DataFrame construction and schema alignment. Entries pin
+# their values list so a recycled id() can never alias a stale frame.
+_DF_CACHE = {}
+
+def _df_from_values(name, values):
+    key = (name, id(values), len(values))
+    hit = _DF_CACHE.get(key)
+    if hit is not None: return hit[1]
+    if len(_DF_CACHE) > 32: _DF_CACHE.clear()
+    df = apply_schema(name, values_to_df(values))
+    _DF_CACHE[key] = (values, df)
+    return df
+
+def get_df(sh, name):
+    try:
+        data = fetch_sheet_data_cached(sh, name)
+        return _df_from_values(name, data)
+    except gspread.WorksheetNotFound:
+        return apply_schema(name, pd.DataFrame())
+    except Exception:
+        return pd.DataFrame()
+
+def get_dfs(sh, names):
+    """Fetch several sheets in one values.batchGet round trip."""
+    try:
+        _BATCH_KEYS.add(tuple(names))
+        all_values = fetch_many_cached(sh, tuple(names))
+        return tuple(_df_from_values(n, vals) for n, vals in zip(names, all_values))
+    except Exception:
+        return tuple(get_df(sh, n) for n in names)
+
+def update_full_sheet(sh, name, df):
+    ws = get_ws(sh, name)
+    values = [df.columns.tolist()] + (df.values.tolist() if not df.empty else [])
+    write_retry(ws.resize, rows=max(len(values), 2))
+    write_retry(ws.update, values, value_input_option='RAW')
+    invalidate(name)
+
+# Pending appends live in session_state, not module globals: sessions share
+# the process, and one session entering a batch must not swallow or strand
+# another session's add_row calls.
+
+def _cache_append(sh, name, rows):
+    """Write-through after an append: extend the cached raw values in place so the
+    next rerun renders from memory instead of refetching the sheet."""
+    try:
+        values = fetch_sheet_data_cached(sh, name)
+        if not values: raise ValueError("no cached header")
+        cleaned = [["" if v is None else v for v in r] for r in rows]
+        # If the cache entry had expired, the fetch above already saw the new
+        # rows — don't append them twice.
+        if values[-len(cleaned):] != cleaned: values.extend(cleaned)
+        _disk_write(name, values)
+        # Batch tuples can't be patched in place per-sheet; evict the ones that include it.
+        for key in list(_BATCH_KEYS):
+            if name in key:
+                try: fetch_many_cached.clear(None, key)
+                except Exception: fetch_many_cached.clear()
+    except Exception:
+        invalidate(name)
+
+def flush_writes(sh):
+    pending = st.session_state.pop('pending_writes', {})
+    for name, rows in pending.items():
+        write_retry(get_ws(sh, name).append_rows, rows, value_input_option='RAW')
+        _cache_append(sh, name, rows)
+
+@contextmanager
+def batched_writes(sh):
+    """Queue this session's add_row calls inside the block and flush them one append_rows per sheet."""
+    st.session_state['batching_writes'] = True
+    try: yield
+    finally:
+        st.session_state['batching_writes'] = False
+        flush_writes(sh)
+
+def add_row(sh, name, row):
+    if st.session_state.get('batching_writes'):
+        st.session_state.setdefault('pending_writes', {}).setdefault(name, []).append(row)
+        return
+    ws = get_ws(sh, name)
+    write_retry(ws.append_row, row, value_input_option='RAW')
+    _cache_append(sh, name, [row])
+
+def update_row_by_id(sh, name, id_val, updated_dict, df_current):
+    pos = df_current.attrs.get('id_index', {}).get(str(id_val))
+    if pos is None:
+        idx_list = df_current.index[df_current['ID'].astype(str) == str(id_val)].tolist()
+        if not idx_list: return False
+        pos = df_current.index.get_loc(idx_list[0])
+    idx = df_current.index[pos]
+    for col, val in updated_dict.items(): df_current.at[idx, col] = val
+    # Write only the edited row (header is row 1) instead of re-uploading the whole sheet.
+    row_num = pos + 2
+    ws = get_ws(sh, name)
+    end_a1 = gspread.utils.rowcol_to_a1(row_num, len(df_current.columns))
+    write_retry(ws.batch_update, [{'range': f'A{row_num}:{end_a1}', 'values': [df_current.loc[idx].tolist()]}])
+    invalidate(name)
+    return True
+
+def delete_rows_by_ids(sh, sheet_name, ids, df=None):
+    """Delete several rows in one batch_update, mapping IDs to sheet rows via the (passed or cached) frame."""
+    if df is None: df = get_df(sh, sheet_name)
+    if df.empty or 'ID' not in df.columns: return False
+    id_to_row = {k: i + 2 for k, i in df.attrs.get('id_index', {str(v): i for i, v in enumerate(df['ID'].to_numpy())}).items()}
+    rows = sorted({id_to_row[str(i)] for i in ids if str(i) in id_to_row}, reverse=True)
+    if not rows: return False
+    ws = get_ws(sh, sheet_name)
+    requests = [{'deleteDimension': {'range': {'sheetId': ws.id, 'dimension': 'ROWS', 'startIndex': r - 1, 'endIndex': r}}} for r in rows]
+    write_retry(sh.batch_update, {'requests': requests})
+    invalidate(sheet_name)
+    return True
+
+def delete_row_by_id(sh, sheet_name, id_val, df=None):
+    try: return delete_rows_by_ids(sh, sheet_name, [id_val], df)
+    except Exception: return False
+
+def init_sheets(sh):
+    schema = {
+        "Config": ["Key", "Value"],
+        "Cards": ["ID", "Name", "First4", "Last4", "Limit", "GraceDays", "MatchCode"],
+        "Banks": ["ID", "Name", "Type", "AccNo", "MatchCode"],
+        "Loans": ["ID", "Source", "Type", "Category", "Collateral", "Principal", "Rate", "EMI", "Tenure", "StartDate", "Outstanding", "Status", "DueDay", "MatchCode"],
+        "Active_EMIs": ["ID", "CardID", "Item", "Beneficiary", "TotalVal", "MonthlyEMI", "Start", "Tenure", "Status"],
+        "EMI_Log": ["ID", "EMI_ID", "Date", "Month", "Year", "Amount"],
+        "Transactions": ["ID", "Date", "Year", "Month", "Type", "Category", "Amount", "Notes", "SourceAccount"],
+        "Statements": ["CardID", "Year", "Month", "StmtDate", "Billed", "Unbilled", "UnbilledDate", "Paid", "DueDate"],
+        "Bank_Balances": ["BankID", "Year", "Month", "Balance"],
+        "Loan_Repayments": ["ID", "LoanID", "PaymentDate", "Amount", "Type"],
+        "Card_Payments": ["ID", "CardID", "Year", "Month", "Date", "Amount", "Note"]
+    }
+
+    # Cold-start fast path: if the Config sheet already records this exact
+    # schema, skip the per-sheet header diffing entirely (one read vs N).
+    version = hashlib.md5(repr(schema).encode()).hexdigest()[:8]
+    try: cfg_rows = fetch_sheet_data_cached(sh, "Config")
+    except Exception: cfg_rows = []
+    if any(r[:2] == ["SchemaVersion", version] for r in cfg_rows[1:]): return
+
+    try: existing = get_sheet_titles(sh)
+    except Exception: existing = []
+
+    # One batch read for every existing header row instead of a row_values
+    # round-trip per sheet.
+    present = [n for n in schema if n in existing]
+    headers_map = {}
+    if present:
+        try:
+            resp = api_retry(sh.values_batch_get, [f"'{n}'!1:1" for n in present])
+            headers_map = {n: (vr.get('values') or [[]])[0] for n, vr in zip(present, resp.get('valueRanges', []))}
+        except Exception: headers_map = {}
+
+    for name, cols in schema.items():
+        if name not in existing:
+            try:
+                ws = write_retry(sh.add_worksheet, title=name, rows=100, cols=20)
+                write_retry(ws.update, [cols], 'A1')
+            except gspread.exceptions.APIError as e:
+                if "400" in str(e) or "already exists" in str(e).lower(): pass
+                else: raise e
+        else:
+            ws = get_ws(sh, name)
+            headers = headers_map.get(name)
+            if headers is None:
+                try: headers = api_retry(ws.row_values, 1)
+                except Exception: headers = []
+            new_headers = [c for c in cols if c not in headers]
+            if new_headers:
+                start = gspread.utils.rowcol_to_a1(1, len(headers) + 1)
+                end = gspread.utils.rowcol_to_a1(1, len(headers) + len(new_headers))
+                write_retry(ws.update, [new_headers], f"{start}:{end}")
+
+    # Stamp the validated schema so the next cold start can skip all of the above.
+    try:
+        ws = get_ws(sh, "Config")
+        hit = next((i for i, r in enumerate(cfg_rows[1:], start=2) if r and r[0] == "SchemaVersion"), None)
+        if hit: write_retry(ws.update, [["SchemaVersion", version]], f"A{hit}:B{hit}")
+        else: write_retry(ws.append_rows, [["SchemaVersion", version]], value_input_option='RAW')
+        invalidate("Config")
+    except Exception: pass
+
+# Process-wide, not per-session: one worker validates the schema once and every
+# session, tab and rerun after that skips init_sheets entirely. The SchemaVersion
+# row in Config covers restarts of the process itself.
+@st.cache_resource(show_spinner=False)
+def ensure_sheets(_sh):
+    init_sheets(_sh)
+    return True
+
+# ==========================================
+# 4. COMPONENT: EDITABLE GRID
+# ==========================================
+
+def render_editable_grid(sh, df, sheet_name, key_prefix, hidden_cols=[]):
+    if df.empty:
+        st.info("No records to display.")
+        return
+
+    df_display = df.assign(Delete=False)
+    # data_editor renders categorical columns as selectboxes locked to the
+    # existing categories; decode them so the grid keeps free-text entry.
+    cat_cols = df_display.select_dtypes('category').columns
+    if len(cat_cols): df_display[cat_cols] = df_display[cat_cols].astype(object)
+
+    col_config = {"Delete": st.column_config.CheckboxColumn(required=True)}
+    for h in hidden_cols: col_config[h] = None
+
+    edited_df = st.data_editor(
+        df_display,
+        key=f"{key_prefix}_editor",
+        column_config=col_config,
+        hide_index=True,
+        use_container_width=True,
+        num_rows="fixed"
+    )
+
+    if st.button("💾 Save Changes", key=f"btn_{key_prefix}"):
+        to_delete = edited_df[edited_df["Delete"] == True]
+        if not to_delete.empty:
+            delete_rows_by_ids(sh, sheet_name, to_delete['ID'].tolist(), df)
+            st.toast("🗑️ Rows deleted!", icon="✅")
+
+        # Compare only the rows that survive deletion; after delete_rows_by_ids
+        # the surviving sheet rows line up 1:1 with final_df.
+        keep = ~edited_df["Delete"].values
+        final_df = edited_df.loc[keep].drop(columns=["Delete"]).reset_index(drop=True)
+        base_df = df.loc[keep].reset_index(drop=True)
+        # Row-hash comparison in C instead of cell-by-cell DataFrame.equals.
+        orig_hash = pd.util.hash_pandas_object(base_df.astype(str), index=False).values
+        new_hash = pd.util.hash_pandas_object(final_df.astype(str), index=False).values
+        changed = (orig_hash != new_hash).nonzero()[0]
+
+        if len(changed):
+            # The grid frame is often a filtered slice (per-card payments, one
+            # month of transactions), so positions here are NOT sheet positions.
+            # The full-frame id_index attr survives the filtering and maps each
+            # ID to its sheet row; the full-rewrite shortcut is only safe when
+            # the frame really is the whole sheet.
+            id_index = df.attrs.get('id_index') or {str(v): i for i, v in enumerate(df['ID'].to_numpy())}
+            if len(changed) > 0.3 * len(final_df) and len(df) == len(id_index):
+                update_full_sheet(sh, sheet_name, final_df)
+            else:
+                # Push only the edited rows, one ranged write per row in a single
+                # batch. Rows deleted above shift everything below them up.
+                deleted_rows = sorted(id_index[str(i)] + 2 for i in to_delete['ID'] if str(i) in id_index)
+                ws = get_ws(sh, sheet_name)
+                end_col = gspread.utils.rowcol_to_a1(1, len(final_df.columns))[:-1]
+                data = []
+                for r in changed:
+                    pos = id_index.get(str(final_df['ID'].iloc[r]))
+                    if pos is None: continue
+                    row_num = pos + 2
+                    row_num -= sum(1 for d in deleted_rows if d < row_num)
+                    data.append({'range': f"A{row_num}:{end_col}{row_num}",
+                                 'values': [["" if pd.isna(v) else v for v in final_df.iloc[r]]]})
+                if data:
+                    write_retry(ws.batch_update, data, value_input_option='RAW')
+                    invalidate(sheet_name)
+            st.toast("💾 Changes synced!", icon="✅")
+            st.rerun()
+        elif not to_delete.empty:
+            st.rerun()
+        else:
+            st.info("No changes detected.")
+
+# ==========================================
+# 5. PAGE MODULES
+# ==========================================
+
+def render_dashboard(sh, year, month):
+    st.title(f"📊 Dashboard - {month} {year}")
+    with st.spinner("Crunching numbers..."):
+        stmts, bk = get_dfs(sh, ("Statements", "Bank_Balances"))
+
+        liq = 0.0
+        if not bk.empty:
+            curr_bk = bk[(bk['Year'] == year) & (bk['Month'] == month)]
+            liq = to_float_series(curr_bk['Balance']).sum()
+
+        bill = 0; paid = 0; unbilled = 0
+        if not stmts.empty:
+            curr_stmts = stmts.loc[(stmts['Year'] == year) & (stmts['Month'] == month)]
+            if not curr_stmts.empty:
+                bill = to_float_series(curr_stmts['Billed']).sum()
+                paid = to_float_series(curr_stmts['Paid']).sum()
+                unbilled = to_float_series(curr_stmts['Unbilled']).sum()
+
+        pending = max(0, bill - paid)
+        liability = pending + unbilled
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("💰 Net Liquidity", f"₹{liq:,.0f}")
+    c2.metric("🧾 Pending Bills", f"₹{pending:,.0f}", delta_color="inverse")
+    c3.metric("📉 Total Liability", f"₹{liability:,.0f}")
+
+def render_credit_cards(sh, year, month):
+    st.title("💳 Credit Cards")
+    cards, stmts, cpays = get_dfs(sh, ("Cards", "Statements", "Card_Payments"))
+    tab_view, tab_manage = st.tabs(["Overview", "Manage Cards"])
+
+    with tab_view:
+        if cards.empty:
+            st.warning("No cards found.")
+            return
+
+        # One pass to compute stats and build HTML, one st.markdown for all summary
+        # boxes (a single delta message), then the interactive expanders below.
+        # Index this month's statements and payments once; the card loop then
+        # does dict lookups instead of re-filtering both frames per card.
+        month_stmts = filter_month(stmts, year, month)
+        stmt_idx = {r['CardID']: r for r in month_stmts.to_dict('records')} if not month_stmts.empty else {}
+        month_pays = filter_month(cpays, year, month)
+        pays_by_card = dict(tuple(month_pays.groupby('CardID'))) if not month_pays.empty else {}
+
+        today = date.today()
+        card_stats = []; html_parts = []
+        for row in cards.to_dict('records'):
+            hist_df = pays_by_card.get(row['ID'], cpays.iloc[0:0])
+            r = stmt_idx.get(row['ID'])
+
+            curr_b = 0.0; curr_p = 0.0; curr_d = ""; curr_stmt_dt = ""; curr_unb = 0.0; curr_unb_dt = ""
+            if r is not None:
+                curr_b = safe_float(r['Billed'])
+                calc_paid = to_float_series(hist_df['Amount']).sum()
+                curr_p = calc_paid if not hist_df.empty else safe_float(r['Paid'])
+                curr_d = str(r['DueDate'])
+                curr_stmt_dt = str(r.get('StmtDate', ''))
+                curr_unb = safe_float(r.get('Unbilled', 0))
+                curr_unb_dt = str(r.get('UnbilledDate', ''))
+
+            rem = max(0, curr_b - curr_p)
+            status_cls = "neutral-bg"
+            if curr_b > 0:
+                if rem <= 1: status_cls = "paid-bg"
+                elif (due_d := safe_date(curr_d)) and (due_d - today).days < 0: status_cls = "overdue-bg"
+                else: status_cls = "due-bg"
+
+            html_parts.append(f"""
+            <div class="card-container {status_cls}">
+                <div style="display:flex; justify-content:space-between;">
+                    <h3>{row['Name']}</h3> <span>Due: ₹{rem:,.2f}</span>
+                </div>
+                <div>Billed: ₹{curr_b:,.2f} | Paid: ₹{curr_p:,.2f} | Unbilled: ₹{curr_unb:,.2f}</div>
+                <div>Stmt: {curr_stmt_dt or '-'} | Due date: {curr_d or '-'}</div>
+            </div>""")
+            card_stats.append((row, hist_df, rem, curr_b, curr_p, curr_d, curr_stmt_dt, curr_unb, curr_unb_dt))
+
+        st.markdown("".join(html_parts), unsafe_allow_html=True)
+
+        for row, hist_df, rem, curr_b, curr_p, curr_d, curr_stmt_dt, curr_unb, curr_unb_dt in card_stats:
+            with st.expander(f"Manage {row['Name']}", expanded=(rem > 0)):
+                with st.form(f"st_{row['ID']}"):
+                    c1, c2, c3 = st.columns(3)
+                    s_dt = c1.date_input("Stmt Date", value=safe_date(curr_stmt_dt))
+                    d_dt = c2.date_input("Due Date", value=safe_date(curr_d) or date.today())
+                    b_amt = c3.number_input("Bill Amt", value=curr_b)
+                    st.markdown("---")
+                    u1, u2 = st.columns(2)
+                    u_amt = u1.number_input("Unbilled Amt", value=curr_unb)
+                    u_date = u2.date_input("Unbilled As Of", value=safe_date(curr_unb_dt) or date.today())
+
+                    if st.form_submit_button("💾 Update Statement"):
+                        # Upsert this card's month row directly — no concat + full-sheet rewrite.
+                        new_row = {"CardID": row['ID'], "Year": year, "Month": month, "StmtDate": str(s_dt), "Billed": b_amt, "Unbilled": u_amt, "UnbilledDate": str(u_date), "Paid": curr_p, "DueDate": str(d_dt)}
+                        cols = stmts.columns.tolist() if len(stmts.columns) else REQUIRED_COLS["Statements"]
+                        hit = [] if stmts.empty else stmts.index[(stmts['CardID'] == row['ID']) & (stmts['Year'] == year) & (stmts['Month'] == month)].tolist()
+                        if hit:
+                            r_num = stmts.index.get_loc(hit[0]) + 2
+                            ws = get_ws(sh, "Statements")
+                            write_retry(ws.batch_update, [{'range': f'A{r_num}:{gspread.utils.rowcol_to_a1(r_num, len(cols))}', 'values': [[new_row.get(c, stmts.at[hit[0], c]) for c in cols]]}])
+                            invalidate("Statements")
+                        else:
+                            add_row(sh, "Statements", [new_row.get(c, "") for c in cols])
+                        st.toast("Statement updated!", icon="✅")
+                        st.rerun()
+
+                with st.form(f"p_{row['ID']}"):
+                    c1, c2 = st.columns([1, 2])
+                    p_amt = c1.number_input("Pay Amount", value=float(rem))
+                    nt = c2.text_input("Notes")
+                    if st.form_submit_button("💸 Record Payment"):
+                        add_row(sh, "Card_Payments", [get_next_id(cpays, "Card_Payments"), row['ID'], year, month, str(date.today()), p_amt, nt])
+                        st.toast("Payment recorded!", icon="✅")
+                        st.success(f"Recorded ₹{p_amt}")
+                        st.rerun()
+
+                render_editable_grid(sh, hist_df, "Card_Payments", f"cpgrid_{row['ID']}", hidden_cols=["CardID", "Year", "Month"])
+
+    with tab_manage:
+        action = st.radio("Action", ["Add", "Delete"], horizontal=True)
+        if action == "Add":
+            with st.form("add_c"):
+                n = st.text_input("Name"); mc = st.text_input("Match Code"); l = st.number_input("Limit", min_value=0.0, value=0.0, step=1000.0)
+                if st.form_submit_button("Add Card"):
+                    if not check_duplicate(cards, "Name", n):
+                        add_row(sh, "Cards", [get_next_id(cards, "Cards"), n, "", "", l, 20, mc])
+                        st.toast("Card Added!", icon="🎉"); st.rerun()
+        else:
+            del_n = st.selectbox("Select Card", cards['Name'] if not cards.empty else [])
+            if st.button("Delete"):
+                delete_row_by_id(sh, "Cards", dict(zip(cards['Name'], cards['ID']))[del_n], cards)
+                st.toast("Deleted!", icon="🗑️"); st.rerun()
+
+def render_loans(sh, year, month):
+    st.title("🏠 Loans")
+    loans, repay = get_dfs(sh, ("Loans", "Loan_Repayments"))
+    tab_view, tab_manage = st.tabs(["Active", "Manage"])
+
+    with tab_view:
+        active = loans[loans['Status'] == 'Active']
+        if active.empty: st.info("No active loans.")
+        # Parse dates and group this month's repayments once, outside the per-loan loop.
+        month_rows_by_loan = {}
+        if not repay.empty:
+            pd_dates = parse_dates_series(repay['PaymentDate'])
+            curr_mask = (pd_dates.dt.year == year) & (pd_dates.dt.month_name() == month)
+            month_rows_by_loan = dict(tuple(repay.loc[curr_mask].groupby('LoanID')))
+        loan_rows = []; loan_html = []
+        for row in active.to_dict('records'):
+            curr_matches = month_rows_by_loan.get(row['ID'], repay.iloc[0:0])
+            is_paid = not curr_matches.empty
+
+            style = "paid-bg" if is_paid else "overdue-bg"
+            loan_html.append(f"""<div class="card-container {style}">
+                <b>{row['Source']} ({row['Type']})</b><br>
+                EMI: ₹{safe_float(row['EMI']):,.2f} | Bal: ₹{safe_float(row['Outstanding']):,.2f}
+                </div>""")
+            loan_rows.append((row, curr_matches, is_paid))
+
+        if loan_html: st.markdown("".join(loan_html), unsafe_allow_html=True)
+
+        for row, curr_matches, is_paid in loan_rows:
+            with st.expander(f"Repay {row['Source']}"):
+                if st.button(f"Pay EMI (₹{row['EMI']})", key=f"emi_{row['ID']}", disabled=is_paid):
+                    with batched_writes(sh):
+                        add_row(sh, "Loan_Repayments", [get_next_id(repay, "Loan_Repayments"), int(row['ID']), str(date.today()), float(row['EMI']), "EMI"])
+                        update_row_by_id(sh, "Loans", row['ID'], {"Outstanding": max(0, safe_float(row['Outstanding']) - safe_float(row['EMI']))}, loans)
+                    st.toast("Paid!", icon="✅"); st.rerun()
+                render_editable_grid(sh, curr_matches, "Loan_Repayments", f"lp_{row['ID']}", hidden_cols=["LoanID"])
+
+    with tab_manage:
+        with st.form("add_l"):
+            src = st.text_input("Source"); typ = st.text_input("Type"); amt = st.number_input("Principal", min_value=0.0, step=1000.0); emi = st.number_input("EMI", min_value=0.0, step=500.0)
+            if st.form_submit_button("Add Loan"):
+                add_row(sh, "Loans", [get_next_id(loans, "Loans"), src, typ, "", "", amt, 0, emi, 12, str(date.today()), amt, "Active", 5, ""])
+                st.toast("Loan Created!", icon="🎉"); st.rerun()
+
+def render_active_emis(sh, year, month):
+    st.title("📉 Active EMIs")
+    emis, emi_log, cards = get_dfs(sh, ("Active_EMIs", "EMI_Log", "Cards"))
+
+    tab_view, tab_manage = st.tabs(["Active", "Manage"])
+    with tab_view:
+        active = emis[emis['Status'] == 'Active']
+        if active.empty: st.info("No Active EMIs")
+        # This month's paid EMI IDs as one set — the loop then checks membership
+        # instead of running a three-predicate filter per EMI.
+        month_log = filter_month(emi_log, year, month)
+        paid_ids = set(pd.to_numeric(month_log['EMI_ID'], errors='coerce').dropna().astype(int)) if not month_log.empty else set()
+        for row in active.to_dict('records'):
+            is_paid = int(safe_float(row['ID'])) in paid_ids
+            style = "paid-bg" if is_paid else "due-bg"
+            st.markdown(f"""<div class="card-container {style}"><b>{row['Item']}</b>: ₹{safe_float(row['MonthlyEMI']):,.2f}</div>""", unsafe_allow_html=True)
+            if not is_paid and st.button("Mark Paid", key=f"me_{row['ID']}"):
+                add_row(sh, "EMI_Log", [get_next_id(emi_log, "EMI_Log"), int(row['ID']), str(date.today()), month, year, float(row['MonthlyEMI'])])
+                st.toast("Paid!", icon="✅"); st.rerun()
+
+    with tab_manage:
+        mode = st.radio("Mode", ["Add", "Delete"], horizontal=True)
+        if mode == "Add":
+            if cards.empty:
+                st.warning("⚠️ You must add a Credit Card first.")
+            else:
+                with st.form("add_e"):
+                    cn = st.selectbox("Card", cards['Name'])
+                    it = st.text_input("Item"); val = st.number_input("Total", min_value=0.0, step=500.0); mon = st.number_input("Monthly", min_value=0.0, step=500.0)
+                    if st.form_submit_button("Add Plan"):
+                        cid = cards[cards['Name'] == cn].iloc[0]['ID']
+                        add_row(sh, "Active_EMIs", [get_next_id(emis, "Active_EMIs"), int(cid), it, "Self", val, mon, str(date.today()), 12, "Active"])
+                        st.toast("EMI Added!", icon="🎉"); st.rerun()
+        else:
+            del_e = st.selectbox("Select", emis['Item'] if not emis.empty else [])
+            if st.button("Delete"):
+                delete_row_by_id(sh, "Active_EMIs", dict(zip(emis['Item'], emis['ID']))[del_e], emis); st.toast("Deleted!"); st.rerun()
+
+def render_bank_accounts(sh, year, month):
+    st.title("🏦 Bank Accounts")
+    banks, bal_df = get_dfs(sh, ("Banks", "Bank_Balances"))
+    tab_view, tab_manage = st.tabs(["Balances", "Manage"])
+    with tab_view:
+        # One editable grid instead of a number_input per bank — a single widget
+        # regardless of bank count, and the diff tells us exactly what to write.
+        month_bal = filter_month(bal_df, year, month)
+        bal_idx = dict(zip(month_bal['BankID'], to_float_series(month_bal['Balance']))) if not month_bal.empty else {}
+        view = pd.DataFrame({"Bank": banks['Name'].tolist(), "Balance": [bal_idx.get(b, 0.0) for b in banks['ID']]})
+        edited = st.data_editor(view, key="bal_editor", hide_index=True, use_container_width=True,
+                                disabled=["Bank"], num_rows="fixed")
+        if st.button("💾 Save Balances", key="btn_bal"):
+            changed = edited.index[edited['Balance'].ne(view['Balance'])].tolist()
+            if not changed:
+                st.info("No changes detected.")
+            else:
+                # Upsert just the edited banks: one batch_update for existing rows, one append_rows for new ones.
+                ws = get_ws(sh, "Bank_Balances")
+                cols = bal_df.columns.tolist() if len(bal_df.columns) else REQUIRED_COLS["Bank_Balances"]
+                edits = []; appends = []
+                for i in changed:
+                    bid = banks['ID'].iloc[i]
+                    row_vals = {"BankID": bid, "Year": year, "Month": month, "Balance": float(edited['Balance'].iloc[i])}
+                    hit = [] if bal_df.empty else bal_df.index[(bal_df['BankID'] == bid) & (bal_df['Year'] == year) & (bal_df['Month'] == month)].tolist()
+                    if hit:
+                        r = bal_df.index.get_loc(hit[0]) + 2
+                        edits.append({'range': f'A{r}:{gspread.utils.rowcol_to_a1(r, len(cols))}', 'values': [[row_vals.get(c, bal_df.at[hit[0], c]) for c in cols]]})
+                    else:
+                        appends.append([row_vals.get(c, "") for c in cols])
+                if edits: write_retry(ws.batch_update, edits)
+                if appends: write_retry(ws.append_rows, appends, value_input_option='RAW')
+                invalidate("Bank_Balances")
+                st.toast("Synced!", icon="✅"); st.success("Balances updated.")
+    with tab_manage:
+        with st.form("add_b"):
+            bn = st.text_input("Name"); mc = st.text_input("Match Code")
+            if st.form_submit_button("Add Bank"):
+                add_row(sh, "Banks", [get_next_id(banks, "Banks"), bn, "Savings", "", mc]); st.toast("Bank Added!", icon="🎉"); st.rerun()
+
+# ==========================================
+# 5b. INCOME / EXPENSES (Smart Upload PDF + ROBUST Excel)
+# ==========================================
+
+def extract_pdf_text(uploaded_file):
+    """All-pages text; pypdfium2 when installed (PDFium, much faster), pdfplumber otherwise."""
+    data = uploaded_file.read()
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        import io, pdfplumber
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            return "".join(page.extract_text() or "" for page in pdf.pages)
+    doc = pdfium.PdfDocument(data)
+    try: return "\n".join(page.get_textpage().get_text_range() for page in doc)
+    finally: doc.close()
+
+_STMT_LINE_RE = re.compile(r'(?P<date>\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\s+(?P<category>[A-Za-z ]+?)\s+(?P<amount>[-+]?\d[\d,]*\.?\d*)\s*(?P<note>.*)')
+
+def parse_statement_text_to_df(text: str) -> pd.DataFrame:
+    rows = []
+    # finditer streams matches straight off the text — no splitlines list,
+    # no intermediate match list.
+    for m in _STMT_LINE_RE.finditer(text):
+        dt = safe_date(m.group("date"))
+        if not dt: continue
+        amt = safe_float(m.group("amount"))
+        rows.append({
+            "Date": dt, "Year": dt.year, "Month": dt.strftime("%B"),
+            "Type": "Expense" if amt < 0 else "Income",
+            "Category": m.group("category").strip(),
+            "Amount": abs(amt), "Notes": m.group("note").strip(), "SourceAccount": ""
+        })
+    return pd.DataFrame(rows) if rows else pd.DataFrame()
+
+@st.cache_data(show_spinner=False)
+def build_match_map(cards, banks):
+    match_map = {}
+    for src_df in (cards, banks):
+        if src_df.empty or 'MatchCode' not in src_df.columns: continue
+        codes = src_df['MatchCode'].astype(str).str.strip().str.lower()
+        mask = (codes.str.len() > 0) & codes.ne('nan')
+        match_map.update(zip(codes[mask], src_df.loc[mask, 'Name']))
+    return match_map
+
+@st.cache_resource
+def source_pattern(codes):
+    """Compiled alternation over all match codes — one C-level scan instead of K substring checks."""
+    return re.compile("(" + "|".join(re.escape(c) for c in codes) + ")") if codes else None
+
+def detect_source(fname, match_map):
+    fname = str(fname).lower()
+    # Exact-token hit first (HDFC_20240101.csv style): one set intersection.
+    tokens = set(re.split(r'[^a-z0-9]+', fname))
+    hit = next(iter(tokens & match_map.keys()), None)
+    if hit: return match_map[hit]
+    pat = source_pattern(tuple(sorted(match_map)))
+    m = pat.search(fname) if pat else None
+    return match_map[m.group(1)] if m else ""
+
+def load_bank_statement(uploaded_file):
+    """
+    Tries multiple engines to load tricky bank statements (Fake XLSX, HTML, XLS).
+    """
+    # 0. Rust-backed calamine reader when installed — much faster than openpyxl
+    try:
+        uploaded_file.seek(0)
+        return pd.read_excel(uploaded_file, engine='calamine')
+    except Exception: pass
+
+    # 1. Try standard XLSX (openpyxl). When the header row is already in place,
+    #    probe it first (nrows=0) and re-read only the useful columns.
+    try:
+        uploaded_file.seek(0)
+        head = pd.read_excel(uploaded_file, engine='openpyxl', nrows=0)
+        wanted = [c for c in head.columns if any(x in str(c).lower() for x in ['date', 'txn', 'amount', 'amt', 'debit', 'withdraw', 'desc', 'narration', 'particulars'])]
+        uploaded_file.seek(0)
+        if any('date' in str(c).lower() for c in wanted):
+            return pd.read_excel(uploaded_file, engine='openpyxl', usecols=wanted)
+        return pd.read_excel(uploaded_file, engine='openpyxl')
+    except Exception: pass
+
+    # 2. Try old XLS (xlrd)
+    try:
+        uploaded_file.seek(0)
+        return pd.read_excel(uploaded_file, engine='xlrd')
+    except Exception: pass
+
+    # 3. Try HTML Table (fake xls/xlsx)
+    try:
+        uploaded_file.seek(0)
+        dfs = pd.read_html(uploaded_file)
+        if dfs: return dfs[0]
+    except Exception: pass
+
+    # 4. Try CSV — Arrow's threaded parser first, python-engine delimiter sniffing as fallback.
+    #    Same header-probe trick as the openpyxl path: only parse the useful columns.
+    try:
+        uploaded_file.seek(0)
+        head = pd.read_csv(uploaded_file, nrows=0)
+        wanted = [c for c in head.columns if any(x in str(c).lower() for x in ['date', 'txn', 'amount', 'amt', 'debit', 'withdraw', 'desc', 'narration', 'particulars'])]
+        uploaded_file.seek(0)
+        if any('date' in str(c).lower() for c in wanted):
+            return pd.read_csv(uploaded_file, engine='pyarrow', usecols=wanted)
+        df_csv = pd.read_csv(uploaded_file, engine='pyarrow')
+        # A single column usually means a non-comma delimiter; let the sniffer handle it.
+        if len(df_csv.columns) > 1: return df_csv
+    except Exception: pass
+    try:
+        uploaded_file.seek(0)
+        return pd.read_csv(uploaded_file, sep=None, engine='python')
+    except Exception: pass
+
+    return None
+
+def render_transactions(sh, year, month):
+    st.title("💵 Income / Expenses")
+    tx_df = get_df(sh, "Transactions")
+    tab_quick, tab_smart, tab_view = st.tabs(["Quick Entry", "Smart Upload", "Transactions"])
+
+    with tab_quick:
+        st.subheader("Quick manual entry")
+        with st.form("quick_entry"):
+            c1, c2, c3 = st.columns(3)
+            dt = c1.date_input("Date", value=date.today())
+            typ = c2.selectbox("Type", ["Income", "Expense"])
+            cat = c3.text_input("Category")
+            c4, c5 = st.columns(2)
+            amt = c4.number_input("Amount", min_value=0.0, step=100.0)
+            src = c5.text_input("Source Account", value="")
+            note = st.text_input("Notes", value="")
+            if st.form_submit_button("➕ Add Transaction"):
+                row = {"ID": get_next_id(tx_df, "Transactions"), "Date": str(dt), "Year": dt.year, "Month": dt.strftime("%B"), "Type": typ, "Category": cat, "Amount": amt, "Notes": note, "SourceAccount": src}
+                add_row(sh, "Transactions", list(row.values()))
+                st.toast("Transaction added!", icon="✅"); st.rerun()
+
+    with tab_smart:
+        st.subheader("Smart upload from statement (PDF / Excel)")
+        uploaded = st.file_uploader("Upload statement file", type=["pdf", "xls", "xlsx"], key="stmt_upload")
+        parse_btn = st.button("📄 Parse file")
+        parsed_df = None
+
+        if uploaded and parse_btn:
+            file_ext = uploaded.name.split(".")[-1].lower()
+            if file_ext == "pdf":
+                try:
+                    parsed_df = parse_statement_text_to_df(extract_pdf_text(uploaded))
+                    if parsed_df.empty: st.warning("No transactions detected from PDF.")
+                    else: st.success(f"Detected {len(parsed_df)} candidate transactions.")
+                except Exception as e: st.error(f"Error reading PDF: {e}")
+            else:
+                # --- ROBUST EXCEL LOADER ---
+                df_raw = load_bank_statement(uploaded)
+                if df_raw is None or df_raw.empty:
+                    st.error("Failed to read file. It may be encrypted or an unsupported format.")
+                else:
+                    df = df_raw.copy()
+                    # Header Heuristic
+                    if not any(x in str(col).lower() for col in df.columns for x in ['date', 'txn']):
+                        for i, row in df.head(20).iterrows():
+                            if any('date' in s for s in row.astype(str).str.lower()):
+                                df.columns = row; df = df.iloc[i+1:]; break
+                    
+                    # Column Mapping
+                    col_map = {}
+                    for col in df.columns:
+                        lc = str(col).strip().lower()
+                        if "date" in lc: col_map[col] = "Date"
+                        elif any(x in lc for x in ["amount", "amt", "debit", "withdraw"]): col_map[col] = "Amount"
+                        elif any(x in lc for x in ["desc", "narration", "particulars"]): col_map[col] = "Notes"
+                    
+                    df = df.rename(columns=col_map)
+                    df = df.loc[:, ~df.columns.duplicated()]
+                    # Column-wise parse instead of per-row iterrows.
+                    dts = parse_dates_series(df["Date"]) if "Date" in df.columns else pd.Series(pd.NaT, index=df.index)
+                    amts = to_float_series(df["Amount"]) if "Amount" in df.columns else pd.Series(0.0, index=df.index)
+                    notes = df["Notes"].astype(str) if "Notes" in df.columns else pd.Series("", index=df.index)
+                    keep = dts.notna()
+                    parsed_df = pd.DataFrame({
+                        "Date": dts[keep].dt.date, "Year": dts[keep].dt.year, "Month": dts[keep].dt.month_name(),
+                        "Type": (amts[keep] < 0).map({True: "Expense", False: "Income"}), # Logic assumes negative or debit column
+                        "Category": "Imported",
+                        "Amount": amts[keep].abs(), "Notes": notes[keep], "SourceAccount": ""
+                    }).reset_index(drop=True)
+                    if parsed_df.empty: st.warning("No valid rows found.")
+                    else: st.success(f"Detected {len(parsed_df)} transactions.")
+
+        if parsed_df is not None and not parsed_df.empty:
+            # Tag the source account by matching the filename against Cards/Banks MatchCodes.
+            src_name = detect_source(uploaded.name, build_match_map(*get_dfs(sh, ("Cards", "Banks"))))
+            if src_name: parsed_df["SourceAccount"] = src_name
+
+        if 'parsed_upload_df' not in st.session_state: st.session_state.parsed_upload_df = pd.DataFrame()
+        if parsed_df is not None and not parsed_df.empty: st.session_state.parsed_upload_df = parsed_df
+
+        if not st.session_state.parsed_upload_df.empty:
+            review_df = st.data_editor(st.session_state.parsed_upload_df, num_rows="dynamic", use_container_width=True, hide_index=True)
+            if st.button("💾 Save to Transactions"):
+                if review_df.empty:
+                    st.info("No rows left to save."); st.stop()
+                base = reserve_ids(tx_df, "Transactions", len(review_df))
+                review_df.insert(0, "ID", range(base, base + len(review_df)))
+                for c in ["Type", "Category", "SourceAccount"]:
+                    if c not in review_df.columns: review_df[c] = ""
+                # Append the new rows in one call instead of concat + full-sheet rewrite.
+                cols = tx_df.columns.tolist() if len(tx_df.columns) else REQUIRED_COLS["Transactions"]
+                review_df["Date"] = review_df["Date"].astype(str)
+                rows = review_df.reindex(columns=cols, fill_value="").values.tolist()
+                write_retry(get_ws(sh, "Transactions").append_rows, rows, value_input_option='RAW')
+                invalidate("Transactions")
+                st.toast("Smart upload saved!", icon="✅"); st.session_state.parsed_upload_df = pd.DataFrame(); st.rerun()
+
+    with tab_view:
+        st.subheader("Browse / edit transactions")
+        if tx_df.empty: st.info("No transactions recorded yet."); return
+        render_editable_grid(sh, filter_month(tx_df, year, month), "Transactions", "tx_grid")
+
+# ==========================================
+# 6. MAIN APP LOOP
+# ==========================================
+
+def main():
+    st.set_page_config(page_title="Finance Hub", layout="wide", page_icon="📈")
+    inject_custom_css()
+    with st.status("🚀 System Check...", expanded=True) as status:
+        sh = connect_gsheets()
+        ensure_sheets(sh)
+        status.update(label="System Online", state="complete", expanded=False)
+
+    st.sidebar.title("☁️ Finance Hub")
+    curr_y = datetime.now().year
+    year = st.sidebar.selectbox("Year", range(curr_y - 1, curr_y + 5), index=1)
+    month = st.sidebar.selectbox("Month", ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"], index=datetime.now().month - 1)
+    choice = st.sidebar.radio("Go To", ["Dashboard", "Credit Cards", "Loans", "Active EMIs", "Bank Accounts", "Income/Expenses"])
+    if st.sidebar.button("🔄 Refresh Data"): clear_cache(); st.rerun()
+
+    if choice == "Dashboard": render_dashboard(sh, year, month)
+    elif choice == "Credit Cards": render_credit_cards(sh, year, month)
+    elif choice == "Loans": render_loans(sh, year, month)
+    elif choice == "Active EMIs": render_active_emis(sh, year, month)
+    elif choice == "Bank Accounts": render_bank_accounts(sh, year, month)
+    elif choice == "Income/Expenses": render_transactions(sh, year, month)
+
+if __name__ == "__main__":
+    main()